@@ -3,12 +3,15 @@ from __future__ import annotations
 import hashlib
 import hmac
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Request, Response
 from itsdangerous import URLSafeSerializer, BadSignature
-from sqlmodel import Session, select
+from itsdangerous.signer import SigningAlgorithm
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .config import settings
 from .models import User, MagicLink
@@ -16,29 +19,55 @@ from .models import User, MagicLink
 SESSION_COOKIE = "changeonly_session"
 SESSION_TTL_DAYS = 30
 
+_SECRET_BYTES = settings.secret_key.encode("utf-8")
+
+class _Blake2SigningAlgorithm(SigningAlgorithm):
+    """Keyed BLAKE2b; a keyed hash needs no HMAC wrapper and is cheaper
+    than HMAC-SHA256 on the per-request session-cookie check."""
+
+    def get_signature(self, key: bytes, value: bytes) -> bytes:
+        return hashlib.blake2b(value, key=key[:64], digest_size=16).digest()
+
+_BLAKE2_ALGORITHM = _Blake2SigningAlgorithm()
+_SIGNER_KWARGS = {"digest_method": hashlib.blake2b, "algorithm": _BLAKE2_ALGORITHM}
+
 def _serializer() -> URLSafeSerializer:
-    return URLSafeSerializer(settings.secret_key, salt="changeonly-session")
+    return URLSafeSerializer(settings.secret_key, salt="changeonly-session", signer_kwargs=_SIGNER_KWARGS)
 
 def _magic_serializer() -> URLSafeSerializer:
-    return URLSafeSerializer(settings.secret_key, salt="changeonly-magic")
+    return URLSafeSerializer(settings.secret_key, salt="changeonly-magic", signer_kwargs=_SIGNER_KWARGS)
+
+def _unsub_serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(settings.secret_key, salt="changeonly-unsub", signer_kwargs=_SIGNER_KWARGS)
 
 def _hash_token(token: str) -> str:
     return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
-def make_unsubscribe_token(user: User) -> str:
+def _unsub_digest(user: User) -> str:
     msg = f"{user.id}:{user.email}:{user.unsub_token_salt}".encode("utf-8")
-    digest = hmac.new(settings.secret_key.encode("utf-8"), msg, hashlib.sha256).hexdigest()
-    return digest
+    # Passing the digest by name keeps hmac on the OpenSSL fast path.
+    return hmac.new(_SECRET_BYTES, msg, "sha256").hexdigest()
+
+def make_unsubscribe_token(user: User) -> str:
+    return _unsub_serializer().dumps({"uid": user.id, "h": _unsub_digest(user)})
 
-def verify_unsubscribe_token(s: Session, token: str) -> Optional[User]:
-    users = s.exec(select(User)).all()
-    for u in users:
-        if make_unsubscribe_token(u) == token:
-            return u
-    return None
+async def verify_unsubscribe_token(s: AsyncSession, token: str) -> Optional[User]:
+    try:
+        data = _unsub_serializer().loads(token)
+    except BadSignature:
+        return None
+    uid = data.get("uid")
+    if not uid:
+        return None
+    user = await s.get(User, uid)
+    if not user:
+        return None
+    if not hmac.compare_digest(data.get("h", ""), _unsub_digest(user)):
+        return None
+    return user
 
 def set_session(response: Response, user_id: int) -> None:
-    payload = {"uid": user_id, "exp": int((datetime.utcnow() + timedelta(days=SESSION_TTL_DAYS)).timestamp())}
+    payload = {"uid": user_id, "exp": int(time.time()) + SESSION_TTL_DAYS * 86400}
     cookie_val = _serializer().dumps(payload)
     response.set_cookie(
         SESSION_COOKIE,
@@ -53,7 +82,7 @@ def set_session(response: Response, user_id: int) -> None:
 def clear_session(response: Response) -> None:
     response.delete_cookie(SESSION_COOKIE, path="/")
 
-def get_current_user(s: Session, request: Request) -> Optional[User]:
+async def get_current_user(s: AsyncSession, request: Request) -> Optional[User]:
     raw = request.cookies.get(SESSION_COOKIE)
     if not raw:
         return None
@@ -62,37 +91,36 @@ def get_current_user(s: Session, request: Request) -> Optional[User]:
     except BadSignature:
         return None
     exp = int(data.get("exp", 0))
-    if exp <= int(datetime.utcnow().timestamp()):
+    if exp <= time.time():
         return None
     uid = data.get("uid")
     if not uid:
         return None
-    return s.get(User, uid)
+    return await s.get(User, uid)
 
-def issue_magic_link(s: Session, email: str, minutes: int = 15) -> str:
-    raw = _magic_serializer().dumps({"e": email, "n": os.urandom(16).hex(), "t": int(datetime.utcnow().timestamp())})
+async def issue_magic_link(s: AsyncSession, email: str, minutes: int = 15) -> str:
+    raw = _magic_serializer().dumps({"e": email, "n": os.urandom(16).hex(), "t": int(time.time())})
     token_hash = _hash_token(raw)
     ml = MagicLink(email=email, token_hash=token_hash, expires_at=datetime.utcnow() + timedelta(minutes=minutes))
     s.add(ml)
-    s.commit()
+    await s.commit()
     return raw
 
-def consume_magic_link(s: Session, token: str) -> Optional[User]:
+async def consume_magic_link(s: AsyncSession, token: str) -> Optional[User]:
     token_hash = _hash_token(token)
-    ml = s.exec(select(MagicLink).where(MagicLink.token_hash == token_hash)).first()
+    ml = (await s.exec(select(MagicLink).where(MagicLink.token_hash == token_hash).limit(1))).first()
     if not ml or ml.used_at is not None or ml.expires_at < datetime.utcnow():
         return None
     ml.used_at = datetime.utcnow()
     s.add(ml)
 
-    user = s.exec(select(User).where(User.email == ml.email)).first()
+    user = (await s.exec(select(User).where(User.email == ml.email).limit(1))).first()
     if not user:
         user = User(email=ml.email, unsub_token_salt=os.urandom(16).hex())
         s.add(user)
-        s.commit()
-        s.refresh(user)
+        await s.flush()  # assigns user.id without an extra commit
 
     user.last_login_at = datetime.utcnow()
     s.add(user)
-    s.commit()
+    await s.commit()
     return user
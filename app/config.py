@@ -10,6 +10,7 @@ load_dotenv()
 @dataclass(frozen=True)
 class Settings:
     app_name: str = os.getenv("APP_NAME", "ChangeOnly")
+    debug: bool = os.getenv("DEBUG", "0").strip().lower() in ("1", "true", "yes")
     base_url: str = os.getenv("BASE_URL", "http://127.0.0.1:8000")
     secret_key: str = os.getenv("SECRET_KEY", "dev-secret-change-me")
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./changeonly.db")
@@ -21,6 +22,8 @@ class Settings:
 
     poll_interval_minutes: int = int(os.getenv("POLL_INTERVAL_MINUTES", "45"))
 
+    cache_dir: str = os.getenv("CACHE_DIR", "./.cache/filings")
+
     public_rate_limit_per_min: int = int(os.getenv("PUBLIC_RATE_LIMIT_PER_MIN", "60"))
     auth_rate_limit_per_min: int = int(os.getenv("AUTH_RATE_LIMIT_PER_MIN", "10"))
 
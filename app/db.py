@@ -1,23 +1,85 @@
 from __future__ import annotations
 
 from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .config import settings
 
 _engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+
+def _sqlite_on_connect(dbapi_conn, _record) -> None:
+    # WAL lets readers proceed during ingest writes; NORMAL halves the
+    # fsyncs per commit (safe under WAL); mmap serves hot pages without
+    # read() syscalls; temp sort/index spills stay in RAM and the page
+    # cache gets 64 MiB. Applied per connection so pool recycling keeps
+    # them.
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+def _is_sqlite() -> bool:
+    return settings.database_url.startswith("sqlite")
 
 def engine() -> Engine:
     global _engine
     if _engine is None:
         connect_args = {}
-        if settings.database_url.startswith("sqlite"):
+        if _is_sqlite():
             connect_args = {"check_same_thread": False}
-        _engine = create_engine(settings.database_url, echo=False, connect_args=connect_args)
+        _engine = create_engine(
+            settings.database_url,
+            echo=False,
+            connect_args=connect_args,
+            # LIFO checkout keeps handing work to the most recently used
+            # connection, whose SQLite page cache is still warm; pre-ping
+            # and recycle drop stale connections instead of erroring.
+            pool_use_lifo=True,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+        )
+        if _is_sqlite():
+            event.listen(_engine, "connect", _sqlite_on_connect)
     return _engine
 
+def _async_database_url() -> str:
+    if settings.database_url.startswith("sqlite://"):
+        return settings.database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return settings.database_url
+
+def async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            _async_database_url(),
+            echo=False,
+            # aiosqlite defaults to NullPool (a new connection per
+            # checkout); a real pool is what makes the PRAGMA/page-cache
+            # work above pay off.
+            poolclass=AsyncAdaptedQueuePool,
+            pool_use_lifo=True,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+        )
+        if _is_sqlite():
+            event.listen(_async_engine.sync_engine, "connect", _sqlite_on_connect)
+    return _async_engine
+
 def session() -> Session:
     return Session(engine())
 
+def async_session() -> AsyncSession:
+    # expire_on_commit would make post-commit attribute access lazy-load
+    # synchronously, which the async driver forbids.
+    return AsyncSession(async_engine(), expire_on_commit=False)
+
 def create_db_and_tables() -> None:
     SQLModel.metadata.create_all(engine())
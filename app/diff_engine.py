@@ -1,22 +1,31 @@
 from __future__ import annotations
 
-import hashlib
 import re
 from dataclasses import dataclass
-from difflib import HtmlDiff, SequenceMatcher
+from difflib import SequenceMatcher
+from html import escape
 from typing import Dict, List, Tuple
 
-ITEM_RE_10KQ = re.compile(r"(?im)^\s*(item)\s+(\d{1,2})([a-z]?)\s*[\.:]\s*(.+?)\s*$")
-ITEM_RE_8K = re.compile(r"(?im)^\s*(item)\s+(\d{1,2})\.(\d{2})\s*[\.:]\s*(.+?)\s*$")
+import xxhash
+
+DIFF_CONTEXT_LINES = 2
+
+ITEM_RE_10KQ = re.compile(r"^\s*(item)\s+(\d{1,2})([a-z]?)\s*[\.:]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE | re.ASCII)
+ITEM_RE_8K = re.compile(r"^\s*(item)\s+(\d{1,2})\.(\d{2})\s*[\.:]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE | re.ASCII)
+
+_WS_RE = re.compile(r"[ \t]+")
+_BLANK_RE = re.compile(r"\n{3,}")
 
 def normalize_text(s: str) -> str:
     s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = _WS_RE.sub(" ", s)
+    s = _BLANK_RE.sub("\n\n", s)
     return s.strip()
 
 def stable_hash(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+    # Content identity only — xxh3 is far faster than SHA-256 on multi-MB
+    # filings and this hash is never used for anything security-sensitive.
+    return xxhash.xxh3_128_hexdigest(s.encode("utf-8"))
 
 @dataclass
 class ChunkResult:
@@ -73,25 +82,57 @@ def _split_by_matches_8k(t: str, matches) -> Dict[str, Tuple[str, str]]:
     return out
 
 def is_meaningful_change(old: str, new: str) -> bool:
-    o = normalize_text(old)
-    n = normalize_text(new)
+    return _is_meaningful_normalized(normalize_text(old), normalize_text(new))
+
+def _is_meaningful_normalized(o: str, n: str) -> bool:
     if o == n:
         return False
-    ratio = SequenceMatcher(None, o, n).ratio()
-    return ratio < 0.995
+    # A length delta above the ratio threshold can never come back as
+    # "near-identical", so skip the quadratic matcher entirely.
+    longest = max(len(o), len(n), 1)
+    if abs(len(o) - len(n)) / longest > 0.005:
+        return True
+    sm = SequenceMatcher(None, o, n, autojunk=True)
+    if sm.quick_ratio() < 0.995:
+        return True
+    return sm.ratio() < 0.995
+
+def render_diff_html(old_lines: List[str], new_lines: List[str]) -> str:
+    """Render a compact line diff: changed lines as <del>/<ins>, a couple of
+    context lines around each change, long equal runs collapsed."""
+    sm = SequenceMatcher(None, old_lines, new_lines, autojunk=True)
+    parts: List[str] = ['<div class="diff">']
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            block = new_lines[j1:j2]
+            if len(block) > 2 * DIFF_CONTEXT_LINES + 1:
+                for line in block[:DIFF_CONTEXT_LINES]:
+                    parts.append(f'<span class="ctx">{escape(line)}</span>')
+                parts.append('<span class="skip">&hellip;</span>')
+                for line in block[-DIFF_CONTEXT_LINES:]:
+                    parts.append(f'<span class="ctx">{escape(line)}</span>')
+            else:
+                for line in block:
+                    parts.append(f'<span class="ctx">{escape(line)}</span>')
+            continue
+        for line in old_lines[i1:i2]:
+            parts.append(f"<del>{escape(line)}</del>")
+        for line in new_lines[j1:j2]:
+            parts.append(f"<ins>{escape(line)}</ins>")
+    parts.append("</div>")
+    return "".join(parts)
 
 def diff_sections(old_chunks: Dict[str, Tuple[str, str]], new_chunks: Dict[str, Tuple[str, str]]) -> List[Tuple[str, str, str]]:
-    hd = HtmlDiff(tabsize=2, wrapcolumn=120)
     changed: List[Tuple[str, str, str]] = []
     keys = sorted(set(old_chunks.keys()) | set(new_chunks.keys()))
     for key in keys:
         old_title, old_body = old_chunks.get(key, ("", ""))
         new_title, new_body = new_chunks.get(key, ("", ""))
         title = new_title or old_title or key
-        if not is_meaningful_change(old_body, new_body):
+        o = normalize_text(old_body)
+        n = normalize_text(new_body)
+        if not _is_meaningful_normalized(o, n):
             continue
-        old_lines = normalize_text(old_body).splitlines()
-        new_lines = normalize_text(new_body).splitlines()
-        table = hd.make_table(old_lines, new_lines, fromdesc="Previous", todesc="Current", context=True, numlines=2)
-        changed.append((key, title, table))
+        html = render_diff_html(o.splitlines(), n.splitlines())
+        changed.append((key, title, html))
     return changed
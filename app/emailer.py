@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass
+from typing import Optional
 
 import httpx
 
@@ -15,6 +15,25 @@ class EmailResult:
 
 
 class Emailer:
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=20,
+                transport=httpx.AsyncHTTPTransport(
+                    retries=1,
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=32),
+                ),
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def send_html(self, to_email: str, subject: str, html: str) -> EmailResult:
         if not settings.resend_api_key:
             print("\n=== EMAIL_STUB ===")
@@ -25,15 +44,16 @@ class Emailer:
             return EmailResult(ok=True, detail="stubbed")
 
         url = "https://api.resend.com/emails"
-        headers = {"Authorization": f"Bearer {settings.resend_api_key}", "Content-Type": "application/json"}
+        headers = {"Authorization": f"Bearer {settings.resend_api_key}"}
         payload = {"from": settings.resend_from, "to": [to_email], "subject": subject, "html": html}
 
         try:
-            async with httpx.AsyncClient(timeout=20) as client:
-                resp = await client.post(url, headers=headers, content=json.dumps(payload))
-                if 200 <= resp.status_code < 300:
-                    return EmailResult(ok=True, detail="sent")
-                return EmailResult(ok=False, detail=f"resend_error:{resp.status_code}:{resp.text[:200]}")
+            if self._client is None:
+                await self.start()
+            resp = await self._client.post(url, headers=headers, json=payload)
+            if 200 <= resp.status_code < 300:
+                return EmailResult(ok=True, detail="sent")
+            return EmailResult(ok=False, detail=f"resend_error:{resp.status_code}:{resp.text[:200]}")
         except Exception as e:
             return EmailResult(ok=False, detail=f"exception:{e!r}")
 
@@ -1,53 +1,96 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlmodel import Session, select
+import jinja2
+from sqlalchemy.orm import defer
+from sqlmodel import select
 
+from .auth import make_unsubscribe_token
 from .config import settings
-from .diff_engine import chunk_by_items, diff_sections, stable_hash
+from .diff_engine import chunk_by_items, diff_sections
 from .emailer import emailer
 from .models import Alert, Company, DiffSection, Filing, User, Watchlist
 from .sec_client import sec_client
 
 MAX_RECENT_FILINGS_PER_REFRESH = 12
 TICKER_REFRESH_TTL_MIN = 30
-
-def _engine():
-    from .db import engine
-    return engine()
-
-def _escape(s: str) -> str:
-    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
-
-def _unsubscribe_token_for_user(s: Session, user_id: int) -> str:
-    from .auth import make_unsubscribe_token
-    user = s.get(User, user_id)
-    if not user:
-        return ""
-    if not user.unsub_token_salt:
-        import os
-        user.unsub_token_salt = os.urandom(16).hex()
-        s.add(user)
-        s.commit()
-        s.refresh(user)
-    return make_unsubscribe_token(user)
+ALERT_SEND_CONCURRENCY = 8
+
+# Compiled once at import; autoescape covers every interpolated value.
+_ALERT_TMPL = jinja2.Template(
+    """\
+<div style="font-family:system-ui,-apple-system,Segoe UI,Roboto,sans-serif;line-height:1.4">
+  <p><strong>{{ symbol }}</strong> filed a new <strong>{{ form_type }}</strong> on {{ filed_on }}.</p>
+  <p>Changed sections:</p>
+  <ul>{% for section in sections %}<li>{{ section }}</li>{% endfor %}</ul>
+  <p>
+    View filing changes:
+    <a href="{{ filing_link }}">{{ filing_link }}</a><br/>
+    Ticker page:
+    <a href="{{ ticker_link }}">{{ ticker_link }}</a>
+  </p>
+  <hr/>
+  <p style="color:#555;font-size:12px">
+    Informational only. Not investment advice.<br/>
+    <a href="{{ unsub_link }}">Unsubscribe</a>
+  </p>
+</div>""",
+    autoescape=True,
+)
+
+def _session():
+    from .db import async_session
+    return async_session()
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _POOL
+
+def shutdown_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+@functools.lru_cache(maxsize=16)
+def _cached_chunks(raw_text_hash: str, form_type: str, text: str):
+    # Keyed by content hash so the previous filing, chunked when it was
+    # ingested, is not re-chunked when the next one arrives. Workers are
+    # long-lived, so each keeps its own warm cache. Entries retain the full
+    # filing text, hence the small maxsize.
+    return chunk_by_items(form_type, text)
+
+def _diff_job(form_type: str, old_hash: str, old_text: str, new_hash: str, new_text: str):
+    """Runs in a worker process: pure CPU regex + difflib work."""
+    old_chunk = _cached_chunks(old_hash, form_type, old_text)
+    new_chunk = _cached_chunks(new_hash, form_type, new_text)
+    unstructured = bool(new_chunk.unstructured or old_chunk.unstructured)
+    return unstructured, diff_sections(old_chunk.chunks, new_chunk.chunks)
 
 async def refresh_ticker(symbol: str) -> None:
     symbol = symbol.upper().strip()
-    with Session(_engine()) as s:
-        company = s.exec(select(Company).where(Company.symbol == symbol)).first()
+    async with _session() as s:
+        company = (await s.exec(select(Company).where(Company.symbol == symbol).limit(1))).first()
 
     if not company:
         info = await sec_client.lookup_company(symbol)
         if not info:
             return
-        with Session(_engine()) as s:
+        async with _session() as s:
             company = Company(symbol=info.symbol, cik=info.cik, name=info.name, last_refreshed_at=None)
             s.add(company)
-            s.commit()
-            s.refresh(company)
+            await s.commit()
+            await s.refresh(company)
 
     if company.last_refreshed_at and (datetime.utcnow() - company.last_refreshed_at) < timedelta(minutes=TICKER_REFRESH_TTL_MIN):
         return
@@ -62,29 +105,34 @@ async def refresh_ticker(symbol: str) -> None:
     for meta in metas_sorted:
         await ingest_filing(meta)
 
-    with Session(_engine()) as s:
-        company_db = s.exec(select(Company).where(Company.symbol == symbol)).first()
+    async with _session() as s:
+        company_db = (await s.exec(select(Company).where(Company.symbol == symbol).limit(1))).first()
         if company_db:
             company_db.last_refreshed_at = datetime.utcnow()
             s.add(company_db)
-            s.commit()
+            await s.commit()
 
 async def ingest_filing(meta) -> Optional[int]:
-    with Session(_engine()) as s:
-        existing = s.exec(select(Filing).where(Filing.accession_no == meta.accession_no)).first()
+    async with _session() as s:
+        existing = (
+            await s.exec(
+                select(Filing.id).where(Filing.accession_no == meta.accession_no).limit(1)
+            )
+        ).first()
         if existing:
             return None
 
-    raw_text = await sec_client.download_filing_text(meta.filing_txt_url)
-    raw_hash = stable_hash(raw_text)
+    raw_text, raw_hash = await sec_client.download_filing_text(meta.filing_txt_url)
 
-    with Session(_engine()) as s:
-        prev = s.exec(
+    async with _session() as s:
+        prev = (await s.exec(
             select(Filing)
+            .options(defer(Filing.raw_text))
             .where(Filing.symbol == meta.symbol)
             .where(Filing.form_type == meta.form_type)
             .order_by(Filing.filed_at.desc())
-        ).first()
+            .limit(1)
+        )).first()
 
         filing = Filing(
             symbol=meta.symbol,
@@ -100,8 +148,8 @@ async def ingest_filing(meta) -> Optional[int]:
             unstructured=False,
         )
         s.add(filing)
-        s.commit()
-        s.refresh(filing)
+        await s.commit()
+        await s.refresh(filing)
         
         filing_id = filing.id
         prev_id = prev.id if prev else None
@@ -114,89 +162,121 @@ async def ingest_filing(meta) -> Optional[int]:
     return filing_id
 
 async def compute_and_store_diffs(filing_id: int, previous_id: int) -> None:
-    with Session(_engine()) as s:
-        filing = s.get(Filing, filing_id)
-        prev = s.get(Filing, previous_id)
+    async with _session() as s:
+        filing = await s.get(Filing, filing_id)
+        prev = await s.get(Filing, previous_id)
         if not filing or not prev:
             return
 
-        new_chunk = chunk_by_items(filing.form_type, filing.raw_text)
-        old_chunk = chunk_by_items(filing.form_type, prev.raw_text)
+        # Amended/duplicate filings arrive byte-identical; nothing to diff
+        # and no alert fan-out to trigger.
+        if filing.raw_text_hash == prev.raw_text_hash:
+            return
+
+        loop = asyncio.get_running_loop()
+        unstructured, changed = await loop.run_in_executor(
+            _pool(),
+            _diff_job,
+            filing.form_type,
+            prev.raw_text_hash,
+            prev.raw_text,
+            filing.raw_text_hash,
+            filing.raw_text,
+        )
 
-        filing.unstructured = bool(new_chunk.unstructured or old_chunk.unstructured)
+        filing.unstructured = unstructured
         s.add(filing)
-        s.commit()
-
-        changed = diff_sections(old_chunk.chunks, new_chunk.chunks)
-        for section_key, title, html in changed:
-            ds = DiffSection(
-                filing_id=filing.id,
-                previous_filing_id=prev.id,
-                section_key=section_key,
-                section_title=title,
-                diff_html=html,
-            )
-            s.add(ds)
-        s.commit()
+        await s.commit()
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                "filing_id": filing.id,
+                "previous_filing_id": prev.id,
+                "section_key": section_key,
+                "section_title": title,
+                "diff_html": html,
+                "created_at": now,
+            }
+            for section_key, title, html in changed
+        ]
+        if rows:
+            await DiffSection.bulk_insert(s, rows)
+        await s.commit()
 
 async def maybe_send_alerts(filing_id: int) -> None:
-    with Session(_engine()) as s:
-        filing = s.get(Filing, filing_id)
+    async with _session() as s:
+        filing = await s.get(Filing, filing_id, options=[defer(Filing.raw_text)])
         if not filing:
             return
-        diffs = s.exec(select(DiffSection).where(DiffSection.filing_id == filing_id)).all()
+        diffs = (await s.exec(select(DiffSection).where(DiffSection.filing_id == filing_id))).all()
         if not diffs:
             return
 
-        watchers = s.exec(select(Watchlist).where(Watchlist.symbol == filing.symbol)).all()
+        watchers = (await s.exec(select(Watchlist).where(Watchlist.symbol == filing.symbol))).all()
         if not watchers:
             return
 
+        user_ids = [w.user_id for w in watchers]
+        users = {u.id: u for u in (await s.exec(select(User).where(User.id.in_(user_ids)))).all()}
+        already = set(
+            (await s.exec(
+                select(Alert.user_id).where(Alert.filing_id == filing_id).where(Alert.user_id.in_(user_ids))
+            )).all()
+        )
+
+        missing_salt = [u for u in users.values() if not u.unsub_token_salt]
+        if missing_salt:
+            for u in missing_salt:
+                u.unsub_token_salt = os.urandom(16).hex()
+                s.add(u)
+            await s.commit()
+
         changed_sections = [d.section_title or d.section_key for d in diffs]
         subject = f"{filing.symbol} filed a new {filing.form_type} — {len(changed_sections)} change(s) detected"
         filing_link = f"{settings.base_url}/filing/{filing.id}"
         ticker_link = f"{settings.base_url}/ticker/{filing.symbol}"
 
+        recipients = []
         for w in watchers:
-            user = s.get(User, w.user_id)
-            if not user or user.unsubscribed:
-                continue
-            already = s.exec(select(Alert).where(Alert.user_id == user.id).where(Alert.filing_id == filing_id)).first()
-            if already:
+            user = users.get(w.user_id)
+            if not user or user.unsubscribed or user.id in already:
                 continue
 
-            unsubscribe_token = _unsubscribe_token_for_user(s, user.id)
+            unsubscribe_token = make_unsubscribe_token(user)
             unsub_link = f"{settings.base_url}/unsubscribe/{unsubscribe_token}"
-            sections_html = "".join(f"<li>{_escape(x)}</li>" for x in changed_sections)
-
-            html = f"""
-            <div style="font-family:system-ui,-apple-system,Segoe UI,Roboto,sans-serif;line-height:1.4">
-              <p><strong>{_escape(filing.symbol)}</strong> filed a new <strong>{_escape(filing.form_type)}</strong> on {filing.filed_at.date().isoformat()}.</p>
-              <p>Changed sections:</p>
-              <ul>{sections_html}</ul>
-              <p>
-                View filing changes:
-                <a href="{filing_link}">{filing_link}</a><br/>
-                Ticker page:
-                <a href="{ticker_link}">{ticker_link}</a>
-              </p>
-              <hr/>
-              <p style="color:#555;font-size:12px">
-                Informational only. Not investment advice.<br/>
-                <a href="{unsub_link}">Unsubscribe</a>
-              </p>
-            </div>
-            """.strip()
-
-            result = await emailer.send_html(user.email, subject, html)
+
+            html = _ALERT_TMPL.render(
+                symbol=filing.symbol,
+                form_type=filing.form_type,
+                filed_on=filing.filed_at.date().isoformat(),
+                sections=changed_sections,
+                filing_link=filing_link,
+                ticker_link=ticker_link,
+                unsub_link=unsub_link,
+            )
+            recipients.append((user, html))
+
+        if not recipients:
+            return
+
+        sem = asyncio.Semaphore(ALERT_SEND_CONCURRENCY)
+
+        async def _send(email: str, html: str):
+            async with sem:
+                return await emailer.send_html(email, subject, html)
+
+        results = await asyncio.gather(*(_send(user.email, html) for user, html in recipients))
+
+        for (user, _), result in zip(recipients, results):
             status = "sent" if result.ok else "failed"
             detail = (result.detail or "")[:512]
             s.add(Alert(user_id=user.id, filing_id=filing_id, status=status, detail=detail))
-            s.commit()
+        await s.commit()
 
 async def poll_watchlists_once() -> None:
-    with Session(_engine()) as s:
-        symbols = sorted({w.symbol for w in s.exec(select(Watchlist)).all()})
+    async with _session() as s:
+        symbols = (await s.exec(select(Watchlist.symbol).distinct().order_by(Watchlist.symbol))).all()
     for sym in symbols:
         try:
             await refresh_ticker(sym)
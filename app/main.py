@@ -4,17 +4,19 @@ import re
 from datetime import datetime
 from typing import Optional
 
+import jinja2
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlalchemy.orm import defer
+from sqlmodel import select
 
 from .config import settings
 from .migrations import apply_migrations
 from .models import User, Company, Filing, DiffSection, Watchlist, Alert
-from .db import engine
+from .db import async_engine, async_session
 from .security import SecurityHeadersMiddleware
 from .rate_limit import rate_limit_or_429
 from .sec_client import sec_client
@@ -27,12 +29,22 @@ from .auth import (
     clear_session,
 )
 from .emailer import emailer
-from .jobs import refresh_ticker, poll_watchlists_once
+from .jobs import refresh_ticker, poll_watchlists_once, shutdown_pool
 
 app = FastAPI(title=settings.app_name)
 app.add_middleware(SecurityHeadersMiddleware)
 
-templates = Jinja2Templates(directory="app/templates")
+# auto_reload stats every template on each render; only worth it in
+# development. The bytecode cache persists compiled templates across
+# restarts (default location under the system temp dir).
+_jinja_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader("app/templates"),
+    autoescape=jinja2.select_autoescape(("html", "xml")),
+    auto_reload=settings.debug,
+    cache_size=400,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(),
+)
+templates = Jinja2Templates(env=_jinja_env)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 scheduler: Optional[AsyncIOScheduler] = None
@@ -48,6 +60,7 @@ def require_sec_user_agent() -> None:
 async def on_startup():
     require_sec_user_agent()
     apply_migrations()
+    await emailer.start()
     global scheduler
     scheduler = AsyncIOScheduler()
     scheduler.add_job(lambda: poll_watchlists_once(), "interval", minutes=settings.poll_interval_minutes, max_instances=1)
@@ -57,10 +70,15 @@ async def on_startup():
 async def on_shutdown():
     if scheduler:
         scheduler.shutdown(wait=False)
+    await emailer.close()
     await sec_client.close()
+    shutdown_pool()
+    # Pooled aiosqlite connections each hold a worker thread; dispose so
+    # the process can exit promptly.
+    await async_engine().dispose()
 
-def _user(s: Session, request: Request) -> Optional[User]:
-    return get_current_user(s, request)
+async def _user(s, request: Request) -> Optional[User]:
+    return await get_current_user(s, request)
 
 def _is_valid_symbol(sym: str) -> bool:
     return bool(re.fullmatch(r"[A-Z0-9\.\-]{1,16}", sym))
@@ -92,16 +110,24 @@ async def ticker_page(request: Request, symbol: str):
     except Exception as e:
         print(f"[ticker] refresh error {symbol}: {e!r}")
 
-    with Session(engine()) as s:
-        company = s.exec(select(Company).where(Company.symbol == symbol)).first()
+    async with async_session() as s:
+        company = (await s.exec(select(Company).where(Company.symbol == symbol).limit(1))).first()
         if not company:
             return templates.TemplateResponse("error.html", {"request": request, "message": "Ticker not found."}, status_code=404)
 
-        filings = s.exec(select(Filing).where(Filing.symbol == symbol).order_by(Filing.filed_at.desc()).limit(5)).all()
+        filings = (
+            await s.exec(
+                select(Filing)
+                .options(defer(Filing.raw_text))
+                .where(Filing.symbol == symbol)
+                .order_by(Filing.filed_at.desc())
+                .limit(5)
+            )
+        ).all()
         filing_ids = [f.id for f in filings if f.id]
         diffs = []
         if filing_ids:
-            diffs = s.exec(select(DiffSection).where(DiffSection.filing_id.in_(filing_ids))).all()
+            diffs = (await s.exec(select(DiffSection).where(DiffSection.filing_id.in_(filing_ids)))).all()
 
         diffs_by_filing: dict[int, list[DiffSection]] = {}
         for d in diffs:
@@ -127,13 +153,13 @@ async def filing_view(request: Request, id: int):
     if rl:
         return rl
 
-    with Session(engine()) as s:
-        filing = s.get(Filing, id)
+    async with async_session() as s:
+        filing = await s.get(Filing, id, options=[defer(Filing.raw_text)])
         if not filing:
             return templates.TemplateResponse("error.html", {"request": request, "message": "Filing not found."}, status_code=404)
 
-        company = s.exec(select(Company).where(Company.symbol == filing.symbol)).first()
-        diffs = s.exec(select(DiffSection).where(DiffSection.filing_id == id).order_by(DiffSection.section_key)).all()
+        company = (await s.exec(select(Company).where(Company.symbol == filing.symbol).limit(1))).first()
+        diffs = (await s.exec(select(DiffSection).where(DiffSection.filing_id == id).order_by(DiffSection.section_key))).all()
 
         return templates.TemplateResponse(
             "filing.html",
@@ -146,8 +172,8 @@ async def diff_partial(request: Request, diff_id: int):
     rl = rate_limit_or_429(request, "public", settings.public_rate_limit_per_min)
     if rl:
         return rl
-    with Session(engine()) as s:
-        d = s.get(DiffSection, diff_id)
+    async with async_session() as s:
+        d = await s.get(DiffSection, diff_id)
         if not d:
             return HTMLResponse("<div class='muted small'>Missing diff.</div>", status_code=404)
         # Returned fragment includes the diffbox wrapper
@@ -155,13 +181,13 @@ async def diff_partial(request: Request, diff_id: int):
 
 @app.get("/unsubscribe/{token}", response_class=HTMLResponse)
 async def unsubscribe(request: Request, token: str):
-    with Session(engine()) as s:
-        user = verify_unsubscribe_token(s, token)
+    async with async_session() as s:
+        user = await verify_unsubscribe_token(s, token)
         if not user:
             return templates.TemplateResponse("error.html", {"request": request, "message": "Invalid unsubscribe link."}, status_code=400)
         user.unsubscribed = True
         s.add(user)
-        s.commit()
+        await s.commit()
     return templates.TemplateResponse("error.html", {"request": request, "message": "You are unsubscribed. You will no longer receive alerts."}, status_code=200)
 
 @app.get("/terms", response_class=HTMLResponse)
@@ -191,8 +217,8 @@ async def auth_request_send(request: Request, email: str = Form(...)):
     if not re.fullmatch(r"[^@\s]+@[^@\s]+\.[^@\s]+", email):
         return templates.TemplateResponse("auth_request.html", {"request": request, "sent": False, "error": "Invalid email."}, status_code=400)
 
-    with Session(engine()) as s:
-        token = issue_magic_link(s, email, minutes=15)
+    async with async_session() as s:
+        token = await issue_magic_link(s, email, minutes=15)
 
     link = f"{settings.base_url}/auth/verify?token={token}"
     html = f"""
@@ -216,8 +242,8 @@ async def auth_verify(request: Request, token: str = ""):
     if not token:
         return templates.TemplateResponse("auth_verify.html", {"request": request, "ok": False, "message": "Missing token."}, status_code=400)
 
-    with Session(engine()) as s:
-        user = consume_magic_link(s, token)
+    async with async_session() as s:
+        user = await consume_magic_link(s, token)
         if not user:
             return templates.TemplateResponse("auth_verify.html", {"request": request, "ok": False, "message": "Link expired or invalid."}, status_code=400)
 
@@ -235,18 +261,18 @@ async def logout(request: Request):
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    with Session(engine()) as s:
-        user = _user(s, request)
+    async with async_session() as s:
+        user = await _user(s, request)
         if not user:
             return RedirectResponse(url="/auth/request", status_code=302)
 
-        watch = s.exec(select(Watchlist).where(Watchlist.user_id == user.id).order_by(Watchlist.created_at.desc())).all()
+        watch = (await s.exec(select(Watchlist).where(Watchlist.user_id == user.id).order_by(Watchlist.created_at.desc()))).all()
 
-        alerts = s.exec(select(Alert).where(Alert.user_id == user.id).order_by(Alert.sent_at.desc()).limit(20)).all()
+        alerts = (await s.exec(select(Alert).where(Alert.user_id == user.id).order_by(Alert.sent_at.desc()).limit(20))).all()
         filings_by_id = {}
         if alerts:
             ids = [a.filing_id for a in alerts]
-            fs = s.exec(select(Filing).where(Filing.id.in_(ids))).all()
+            fs = (await s.exec(select(Filing).options(defer(Filing.raw_text)).where(Filing.id.in_(ids)))).all()
             filings_by_id = {f.id: f for f in fs}
 
         return templates.TemplateResponse(
@@ -256,8 +282,8 @@ async def dashboard(request: Request):
 
 @app.post("/dashboard/watch/add")
 async def watch_add(request: Request, symbol: str = Form(...)):
-    with Session(engine()) as s:
-        user = _user(s, request)
+    async with async_session() as s:
+        user = await _user(s, request)
         if not user:
             return RedirectResponse(url="/auth/request", status_code=302)
 
@@ -265,7 +291,7 @@ async def watch_add(request: Request, symbol: str = Form(...)):
         if not _is_valid_symbol(symbol):
             return RedirectResponse(url="/dashboard?err=bad_symbol", status_code=302)
 
-        count = len(s.exec(select(Watchlist).where(Watchlist.user_id == user.id)).all())
+        count = len((await s.exec(select(Watchlist).where(Watchlist.user_id == user.id))).all())
         if count >= 30:
             return RedirectResponse(url="/dashboard?err=watch_limit", status_code=302)
 
@@ -273,15 +299,16 @@ async def watch_add(request: Request, symbol: str = Form(...)):
         if not info:
             return RedirectResponse(url="/dashboard?err=bad_symbol", status_code=302)
 
-        comp = s.exec(select(Company).where(Company.symbol == symbol)).first()
+        comp = (await s.exec(select(Company).where(Company.symbol == symbol).limit(1))).first()
         if not comp:
             s.add(Company(symbol=info.symbol, cik=info.cik, name=info.name))
-            s.commit()
 
-        existing = s.exec(select(Watchlist).where(Watchlist.user_id == user.id).where(Watchlist.symbol == symbol)).first()
+        existing = (await s.exec(select(Watchlist).where(Watchlist.user_id == user.id).where(Watchlist.symbol == symbol).limit(1))).first()
         if not existing:
             s.add(Watchlist(user_id=user.id, symbol=symbol))
-            s.commit()
+
+        if not comp or not existing:
+            await s.commit()
 
     try:
         await refresh_ticker(symbol)
@@ -292,25 +319,25 @@ async def watch_add(request: Request, symbol: str = Form(...)):
 
 @app.post("/dashboard/watch/remove")
 async def watch_remove(request: Request, symbol: str = Form(...)):
-    with Session(engine()) as s:
-        user = _user(s, request)
+    async with async_session() as s:
+        user = await _user(s, request)
         if not user:
             return RedirectResponse(url="/auth/request", status_code=302)
 
         symbol = symbol.upper().strip()
-        w = s.exec(select(Watchlist).where(Watchlist.user_id == user.id).where(Watchlist.symbol == symbol)).first()
+        w = (await s.exec(select(Watchlist).where(Watchlist.user_id == user.id).where(Watchlist.symbol == symbol).limit(1))).first()
         if w:
-            s.delete(w)
-            s.commit()
+            await s.delete(w)
+            await s.commit()
     return RedirectResponse(url="/dashboard", status_code=302)
 
 @app.post("/dashboard/email/toggle")
 async def email_toggle(request: Request):
-    with Session(engine()) as s:
-        user = _user(s, request)
+    async with async_session() as s:
+        user = await _user(s, request)
         if not user:
             return RedirectResponse(url="/auth/request", status_code=302)
         user.unsubscribed = not bool(user.unsubscribed)
         s.add(user)
-        s.commit()
+        await s.commit()
     return RedirectResponse(url="/dashboard", status_code=302)
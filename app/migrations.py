@@ -43,7 +43,6 @@ MIGRATIONS: list[tuple[str, str]] = [
             last_refreshed_at TEXT,
             created_at TEXT NOT NULL
         );
-        CREATE INDEX IF NOT EXISTS ix_companies_symbol ON companies(symbol);
         CREATE INDEX IF NOT EXISTS ix_companies_cik ON companies(cik);
         CREATE INDEX IF NOT EXISTS ix_companies_name ON companies(name);
 
@@ -63,7 +62,6 @@ MIGRATIONS: list[tuple[str, str]] = [
             created_at TEXT NOT NULL
         );
         CREATE INDEX IF NOT EXISTS ix_filings_symbol_form_date ON filings(symbol, form_type, filed_at);
-        CREATE INDEX IF NOT EXISTS ix_filings_symbol ON filings(symbol);
         CREATE INDEX IF NOT EXISTS ix_filings_cik ON filings(cik);
         CREATE INDEX IF NOT EXISTS ix_filings_form_type ON filings(form_type);
         CREATE INDEX IF NOT EXISTS ix_filings_filed_at ON filings(filed_at);
@@ -103,6 +101,16 @@ MIGRATIONS: list[tuple[str, str]] = [
         CREATE INDEX IF NOT EXISTS ix_alerts_user_sent ON alerts(user_id, sent_at);
         '''
     ),
+    (
+        "002_drop_redundant_indexes",
+        '''
+        -- ix_filings_symbol is subsumed by ix_filings_symbol_form_date,
+        -- and UNIQUE(symbol) on companies already maintains an index;
+        -- both just doubled B-tree writes per INSERT.
+        DROP INDEX IF EXISTS ix_filings_symbol;
+        DROP INDEX IF EXISTS ix_companies_symbol;
+        '''
+    ),
 ]
 
 def apply_migrations() -> None:
@@ -121,14 +129,17 @@ def apply_migrations() -> None:
         s.commit()
 
         applied = {row[0] for row in s.exec(text("SELECT name FROM migration_state")).all()}
+        pending: list[MigrationState] = []
         for name, sql in MIGRATIONS:
             if name in applied:
                 continue
-            # SQLite doesn't support executing multiple statements via s.exec(text(sql))
-            # So we split by ; and execute them one by one.
-            for statement in sql.split(";"):
-                clean_stmt = statement.strip()
-                if clean_stmt:
-                    s.exec(text(clean_stmt))
-            s.add(MigrationState(name=name))
+            # sqlite3's executescript runs the whole multi-statement DDL
+            # block in one native call instead of one prepared statement
+            # per split-on-";" chunk.
+            s.connection().connection.executescript(sql)
+            pending.append(MigrationState(name=name))
+        if pending:
+            # One commit for the whole batch: N pending migrations cost a
+            # single fsync instead of one each.
+            s.add_all(pending)
             s.commit()
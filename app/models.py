@@ -1,10 +1,24 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Sequence
 
 from sqlmodel import SQLModel, Field, UniqueConstraint, Index
 
+_BULK_INSERT_CHUNK = 50
+
+
+class BulkInsertMixin:
+    """Chunked executemany insert; ORM add() emits one INSERT per instance,
+    which dominates ingest time for wide batches. Rows are plain column
+    dicts and must include Python-side defaults such as created_at."""
+
+    @classmethod
+    async def bulk_insert(cls, session, rows: Sequence[dict]) -> None:
+        table = cls.__table__  # type: ignore[attr-defined]
+        for i in range(0, len(rows), _BULK_INSERT_CHUNK):
+            await session.execute(table.insert(), list(rows[i : i + _BULK_INSERT_CHUNK]))
+
 
 class MigrationState(SQLModel, table=True):
     __tablename__ = "migration_state"
@@ -40,7 +54,7 @@ class Company(SQLModel, table=True):
     __tablename__ = "companies"
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    symbol: str = Field(index=True, unique=True, max_length=16)
+    symbol: str = Field(unique=True, max_length=16)  # UNIQUE already indexes
     cik: str = Field(index=True, max_length=16)
     name: str = Field(index=True, max_length=256)
 
@@ -48,7 +62,7 @@ class Company(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
-class Filing(SQLModel, table=True):
+class Filing(BulkInsertMixin, SQLModel, table=True):
     __tablename__ = "filings"
     __table_args__ = (
         UniqueConstraint("accession_no", name="uq_filings_accession"),
@@ -57,7 +71,7 @@ class Filing(SQLModel, table=True):
 
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    symbol: str = Field(index=True, max_length=16)
+    symbol: str = Field(max_length=16)  # covered by the composite index
     cik: str = Field(index=True, max_length=16)
 
     form_type: str = Field(index=True, max_length=16)
@@ -76,7 +90,7 @@ class Filing(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
-class DiffSection(SQLModel, table=True):
+class DiffSection(BulkInsertMixin, SQLModel, table=True):
     __tablename__ = "diff_sections"
     __table_args__ = (
         UniqueConstraint("filing_id", "section_key", name="uq_diffs_filing_section"),
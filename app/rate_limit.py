@@ -1,46 +1,54 @@
 from __future__ import annotations
 
+import threading
 import time
-from dataclasses import dataclass
 from typing import Dict, Tuple
 
 from fastapi import Request
 from starlette.responses import Response
 
+N_SHARDS = 16  # must be a power of two for the mask below
+
 
-@dataclass
 class Bucket:
-    capacity: int
-    refill_per_sec: float
-    tokens: float
-    last: float
+    # Slots drop the per-instance __dict__ (~half the memory with many
+    # tracked IPs) and make the attribute churn in allow() a bit cheaper.
+    __slots__ = ("capacity", "refill_per_sec", "tokens", "last")
+
+    def __init__(self, capacity: int, refill_per_sec: float, tokens: float, last: float) -> None:
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = tokens
+        self.last = last
 
 
 class InMemoryRateLimiter:
-    def __init__(self) -> None:
-        self.buckets: Dict[str, Bucket] = {}
+    """Token buckets sharded by key hash; each shard has its own lock so
+    concurrent threads only contend when they hash to the same shard."""
 
-    def _get_bucket(self, key: str, capacity: int, per_min: int) -> Bucket:
-        now = time.time()
-        refill_per_sec = per_min / 60.0
-        b = self.buckets.get(key)
-        if not b:
-            b = Bucket(capacity=capacity, refill_per_sec=refill_per_sec, tokens=float(capacity), last=now)
-            self.buckets[key] = b
-        return b
+    def __init__(self) -> None:
+        self._shards: list[Dict[str, Bucket]] = [{} for _ in range(N_SHARDS)]
+        self._locks: list[threading.Lock] = [threading.Lock() for _ in range(N_SHARDS)]
 
     def allow(self, key: str, per_min: int, capacity: int | None = None) -> Tuple[bool, int]:
         if capacity is None:
             capacity = per_min
-        b = self._get_bucket(key, capacity=capacity, per_min=per_min)
-        now = time.time()
-        elapsed = max(0.0, now - b.last)
-        b.last = now
-        b.tokens = min(b.capacity, b.tokens + elapsed * b.refill_per_sec)
-        if b.tokens >= 1.0:
-            b.tokens -= 1.0
-            return True, int(b.tokens)
-        return False, int(b.tokens)
+        # Monotonic so NTP adjustments can't grant (or swallow) tokens.
+        now = time.monotonic()
+        shard = hash(key) & (N_SHARDS - 1)
+        with self._locks[shard]:
+            buckets = self._shards[shard]
+            b = buckets.get(key)
+            if not b:
+                b = Bucket(capacity=capacity, refill_per_sec=per_min / 60.0, tokens=float(capacity), last=now)
+                buckets[key] = b
+            elapsed = max(0.0, now - b.last)
+            b.last = now
+            b.tokens = min(b.capacity, b.tokens + elapsed * b.refill_per_sec)
+            if b.tokens >= 1.0:
+                b.tokens -= 1.0
+                return True, int(b.tokens)
+            return False, int(b.tokens)
 
 rate_limiter = InMemoryRateLimiter()
 
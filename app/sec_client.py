@@ -1,13 +1,22 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
 import re
+import tempfile
 import time
+import zlib
+from bisect import bisect_right
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from pathlib import Path
 from typing import Any, Optional
 
 import httpx
+import orjson
+import xxhash
+from selectolax.parser import HTMLParser
 
 from .config import settings
 
@@ -16,6 +25,14 @@ SEC_SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik}.json"
 
 SUPPORTED_FORMS = {"10-K", "10-Q", "8-K"}
 
+SEC_MAX_RPS = 5
+
+_RETRYABLE_STATUS = frozenset({403, 429, 500, 502, 503, 504})
+
+_WS_EOL_RE = re.compile(r"[ \t]+\n")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
+_MULTI_SP_RE = re.compile(r"[ \t]{2,}")
+
 @dataclass
 class CompanyInfo:
     symbol: str
@@ -37,8 +54,28 @@ class SecClient:
     def __init__(self) -> None:
         self._ticker_cache: dict[str, CompanyInfo] = {}
         self._ticker_cache_loaded_at: Optional[datetime] = None
-        self._http = httpx.AsyncClient(timeout=30, headers=self._headers())
-        self._global_next_ok = 0.0  # throttle
+        # Parallel lists rebuilt with the cache; search scans these instead
+        # of re-uppercasing every company name per query.
+        self._all_syms: list[str] = []
+        self._all_infos: list[CompanyInfo] = []
+        self._name_upper: list[str] = []
+        # One "SYM\x1fNAME" row per company, NUL-joined; a query is a
+        # single C-level str.find pass over this instead of ~10k Python
+        # loop iterations. _search_starts maps hit offsets back to rows.
+        self._search_blob: str = ""
+        self._search_starts: list[int] = [0]
+        # HTTP/2 multiplexes concurrent EDGAR calls over one TLS
+        # connection; the pool is capped near the 5 rps throttle so idle
+        # sockets aren't held open.
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=8),
+            headers=self._headers(),
+        )
+        self._sem = asyncio.Semaphore(SEC_MAX_RPS)
+        self._recent_starts: deque[float] = deque()
+        self._cache_dir = Path(settings.cache_dir)
 
     def _headers(self) -> dict[str, str]:
         ua = settings.sec_user_agent.strip() or "ChangeOnly (missing SEC_USER_AGENT; set env var)"
@@ -48,31 +85,50 @@ class SecClient:
         await self._http.aclose()
 
     async def _throttle(self) -> None:
-        now = time.time()
-        if now < self._global_next_ok:
-            await asyncio.sleep(self._global_next_ok - now)
-        self._global_next_ok = time.time() + 0.2  # ~5 rps max
+        # Sliding one-second window of request starts. Unlike the old
+        # serialized next-ok timestamp, up to SEC_MAX_RPS fetches can be
+        # in flight at once while still respecting EDGAR's rate cap.
+        while True:
+            now = time.monotonic()
+            while self._recent_starts and now - self._recent_starts[0] >= 1.0:
+                self._recent_starts.popleft()
+            if len(self._recent_starts) < SEC_MAX_RPS:
+                self._recent_starts.append(now)
+                return
+            await asyncio.sleep(1.0 - (now - self._recent_starts[0]))
 
-    async def _get_with_backoff(self, url: str, expect_json: bool = True) -> Any:
+    async def _retry_with_backoff(self, attempt, url: str) -> Any:
+        """Run a throttled request attempt with exponential backoff.
+        `attempt` returns the result, or None when the response status was
+        retryable; non-retryable failures raise from inside `attempt`."""
         delay = 0.5
         for _attempt in range(6):
-            await self._throttle()
+            async with self._sem:
+                await self._throttle()
+                result = await attempt()
+            if result is not None:
+                return result
+            await asyncio.sleep(delay)
+            delay = min(10.0, delay * 2)
+        raise RuntimeError(f"SEC GET failed after retries: {url}")
+
+    async def _get_with_backoff(self, url: str, expect_json: bool = True) -> Any:
+        async def attempt():
             resp = await self._http.get(url)
             if resp.status_code == 200:
-                return resp.json() if expect_json else resp.text
-            if resp.status_code in (403, 429, 500, 502, 503, 504):
-                await asyncio.sleep(delay)
-                delay = min(10.0, delay * 2)
-                continue
+                return orjson.loads(resp.content) if expect_json else resp.text
+            if resp.status_code in _RETRYABLE_STATUS:
+                return None
             raise RuntimeError(f"SEC GET failed {resp.status_code}: {url} ({resp.text[:120]})")
-        raise RuntimeError(f"SEC GET failed after retries: {url}")
+
+        return await self._retry_with_backoff(attempt, url)
 
     async def load_ticker_map(self, force: bool = False) -> dict[str, CompanyInfo]:
         if (not force) and self._ticker_cache_loaded_at and (datetime.utcnow() - self._ticker_cache_loaded_at) < timedelta(hours=24):
             return self._ticker_cache
         data = await self._get_with_backoff(SEC_TICKER_MAP_URL, expect_json=True)
         cache: dict[str, CompanyInfo] = {}
-        for _, row in data.items():
+        for row in data.values():
             sym = str(row.get("ticker", "")).upper().strip()
             cik = str(row.get("cik_str", "")).strip()
             name = str(row.get("title", "")).strip()
@@ -80,6 +136,15 @@ class SecClient:
                 continue
             cache[sym] = CompanyInfo(symbol=sym, cik=str(cik).zfill(10), name=name)
         self._ticker_cache = cache
+        self._all_syms = list(cache.keys())
+        self._all_infos = list(cache.values())
+        self._name_upper = [info.name.upper() for info in self._all_infos]
+        rows = [f"{sym}\x1f{name}" for sym, name in zip(self._all_syms, self._name_upper)]
+        starts = [0]
+        for row in rows:
+            starts.append(starts[-1] + len(row) + 1)
+        self._search_blob = "\x00".join(rows)
+        self._search_starts = starts
         self._ticker_cache_loaded_at = datetime.utcnow()
         return cache
 
@@ -92,13 +157,15 @@ class SecClient:
         q = query.strip().upper()
         if not q:
             return []
-        m = await self.load_ticker_map()
+        await self.load_ticker_map()
         out: list[CompanyInfo] = []
-        for sym, info in m.items():
-            if q in sym or q in info.name.upper():
-                out.append(info)
-                if len(out) >= limit:
-                    break
+        pos = self._search_blob.find(q)
+        while pos != -1 and len(out) < limit:
+            row = bisect_right(self._search_starts, pos) - 1
+            out.append(self._all_infos[row])
+            # Jump past this row so a company matching on both symbol and
+            # name is returned once.
+            pos = self._search_blob.find(q, self._search_starts[row + 1])
         return out
 
     async def get_recent_filings(self, company: CompanyInfo, limit: int = 10) -> list[SecFilingMeta]:
@@ -111,14 +178,20 @@ class SecClient:
         filed_dates = filings.get("filingDate", []) or []
         primary_docs = filings.get("primaryDocument", []) or []
 
+        base_url = f"https://www.sec.gov/Archives/edgar/data/{int(company.cik)}"
+
+        # Most recent filings are unsupported forms (4s, S-8s, ...); pick
+        # the qualifying rows first so the loop below never touches the
+        # ~80% of rows that get dropped. The feed is all strings already.
+        n = min(len(forms), len(accession), len(filed_dates), len(primary_docs))
+        keep_idx = [i for i in range(n) if forms[i] in SUPPORTED_FORMS][:limit]
+
         items: list[SecFilingMeta] = []
-        for i in range(min(len(forms), len(accession), len(filed_dates), len(primary_docs))):
-            form = str(forms[i]).strip()
-            if form not in SUPPORTED_FORMS:
-                continue
-            acc = str(accession[i]).strip()
-            date_str = str(filed_dates[i]).strip()
-            doc = str(primary_docs[i]).strip()
+        for i in keep_idx:
+            form = forms[i]
+            acc = accession[i]
+            date_str = filed_dates[i]
+            doc = primary_docs[i]
 
             try:
                 dt = datetime.fromisoformat(date_str)
@@ -126,8 +199,8 @@ class SecClient:
                 dt = datetime.strptime(date_str, "%Y-%m-%d")
 
             acc_nodash = acc.replace("-", "")
-            filing_txt_url = f"https://www.sec.gov/Archives/edgar/data/{int(company.cik)}/{acc_nodash}/{acc}.txt"
-            filing_index_url = f"https://www.sec.gov/Archives/edgar/data/{int(company.cik)}/{acc_nodash}/{acc}-index.html"
+            filing_txt_url = f"{base_url}/{acc_nodash}/{acc}.txt"
+            filing_index_url = f"{base_url}/{acc_nodash}/{acc}-index.html"
 
             items.append(
                 SecFilingMeta(
@@ -141,22 +214,84 @@ class SecClient:
                     filing_index_url=filing_index_url,
                 )
             )
-            if len(items) >= limit:
-                break
         return items
 
-    async def download_filing_text(self, filing_txt_url: str) -> str:
-        txt = await self._get_with_backoff(filing_txt_url, expect_json=False)
-        return self._extract_reasonable_text(txt)
+    def _cache_path(self, url: str) -> Path:
+        return self._cache_dir / f"{xxhash.xxh3_128_hexdigest(url)}.zt"
+
+    def _cache_get(self, url: str) -> Optional[tuple[str, str]]:
+        try:
+            payload = self._cache_path(url).read_bytes()
+            digest, _, body = payload.partition(b"\n")
+            return zlib.decompress(body).decode("utf-8"), digest.decode("ascii")
+        except (OSError, zlib.error, ValueError):
+            return None
+
+    def _cache_put(self, url: str, text: str, digest: str) -> None:
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            path = self._cache_path(url)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(digest.encode("ascii") + b"\n" + zlib.compress(text.encode("utf-8"), 6))
+            tmp.replace(path)  # atomic, so readers never see a partial file
+        except OSError:
+            pass  # cache is best-effort; the download already succeeded
+
+    async def download_filing_text(self, filing_txt_url: str) -> tuple[str, str]:
+        """Stream a filing body to a spooled temp file, hashing the bytes as
+        they arrive, then extract readable text in one pass. Returns
+        (extracted_text, xxh3_of_raw_bytes); streaming keeps peak memory at
+        roughly one decoded copy instead of response buffer + text + copies.
+
+        Extracted text is cached on disk keyed by URL — accession URLs are
+        immutable, so steady-state polls skip the network entirely."""
+        cached = self._cache_get(filing_txt_url)
+        if cached is not None:
+            return cached
+
+        async def attempt():
+            digest = xxhash.xxh3_128()
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as buf:
+                async with self._http.stream("GET", filing_txt_url) as resp:
+                    if resp.status_code == 200:
+                        async for chunk in resp.aiter_bytes(65536):
+                            digest.update(chunk)
+                            buf.write(chunk)
+                        buf.seek(0)
+                        return self._extract_from_file(buf), digest.hexdigest()
+                    if resp.status_code in _RETRYABLE_STATUS:
+                        return None
+                    raise RuntimeError(f"SEC GET failed {resp.status_code}: {filing_txt_url}")
+
+        text, raw_hash = await self._retry_with_backoff(attempt, filing_txt_url)
+        self._cache_put(filing_txt_url, text, raw_hash)
+        return text, raw_hash
+
+    def _extract_from_file(self, buf) -> str:
+        # Incremental decode avoids materializing the whole body as one
+        # bytes object next to its decoded string.
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        pieces: list[str] = []
+        while True:
+            chunk = buf.read(1 << 20)
+            if not chunk:
+                pieces.append(decoder.decode(b"", final=True))
+                break
+            pieces.append(decoder.decode(chunk))
+        return self._extract_reasonable_text("".join(pieces))
 
     def _extract_reasonable_text(self, raw: str) -> str:
         raw = raw.replace("\x00", " ")
-        raw = re.sub(r"(?is)<script.*?>.*?</script>", " ", raw)
-        raw = re.sub(r"(?is)<style.*?>.*?</style>", " ", raw)
-        raw = re.sub(r"(?is)<[^>]+>", " ", raw)
-        raw = re.sub(r"[ \t]+\n", "\n", raw)
-        raw = re.sub(r"\n{3,}", "\n\n", raw)
-        raw = re.sub(r"[ \t]{2,}", " ", raw)
-        return raw.strip()
+        # A C tokenizer walks multi-MB filings in one pass; the previous
+        # non-greedy DOTALL regexes were quadratic on pathological markup.
+        tree = HTMLParser(raw)
+        for node in tree.css("script, style"):
+            node.decompose()
+        body = tree.body
+        text = body.text(separator="\n") if body is not None else tree.text(separator="\n")
+        text = _WS_EOL_RE.sub("\n", text)
+        text = _MULTI_NL_RE.sub("\n\n", text)
+        text = _MULTI_SP_RE.sub(" ", text)
+        return text.strip()
 
 sec_client = SecClient()
@@ -1,32 +1,34 @@
+import os
 import zipfile
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent
 OUT = ROOT / "changeonly.zip"
 
-EXCLUDE_DIRS = {".venv", "__pycache__", ".git", ".mypy_cache", ".pytest_cache"}
-EXCLUDE_FILES = {"changeonly.zip", ".env"}
-
-def should_exclude(path: Path) -> bool:
-    parts = set(path.parts)
-    if parts & EXCLUDE_DIRS:
-        return True
-    if path.name in EXCLUDE_FILES:
-        return True
-    return False
+EXCLUDE_DIRS = frozenset({".venv", "__pycache__", ".git", ".mypy_cache", ".pytest_cache", ".cache"})
+EXCLUDE_FILES = frozenset({"changeonly.zip", ".env"})
 
 def main():
     if OUT.exists():
         OUT.unlink()
 
-    with zipfile.ZipFile(OUT, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in ROOT.rglob("*"):
-            if p.is_dir():
-                continue
-            rel = p.relative_to(ROOT)
-            if should_exclude(rel):
+    # os.walk with in-place dirname pruning never descends into excluded
+    # trees, so .venv/.git contents cost zero stat calls.
+    files: list[Path] = []
+    for dirpath, dirnames, filenames in os.walk(ROOT):
+        dirnames[:] = [d for d in dirnames if d not in EXCLUDE_DIRS]
+        for fn in filenames:
+            if fn in EXCLUDE_FILES:
                 continue
-            z.write(p, rel)
+            files.append(Path(dirpath) / fn)
+    files.sort()
+
+    # Level 1 deflate is several times faster than the default level 6
+    # and costs ~10% archive size; sorting keeps the archive layout
+    # deterministic across filesystems.
+    with zipfile.ZipFile(OUT, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+        for p in files:
+            z.write(p, p.relative_to(ROOT))
 
     print(f"Created: {OUT}")
 